@@ -1,5 +1,6 @@
 # app/config.py
 import tempfile
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 
@@ -36,7 +37,8 @@ class Settings(BaseSettings):
     # === GeoIP Database (Optional key, Recommended settings) ===
     GEOIP_DB_PATH: Path = BASE_DIR / "geoip" / "GeoLite2-City.mmdb"
     GEOIP_UPDATE_DAYS: int = 28
-    GEOIP_CACHE_SIZE: int = 1000
+    GEOIP_CACHE_SIZE: int = 65536
+    GEOIP_DB_CACHE_SIZE: int = 50000
     GEOIP_DOWNLOAD_TIMEOUT_SECONDS: int = 60
     MAXMIND_ACCOUNT_ID: int | None = None
     MAXMIND_LICENSE_KEY: str | None = None
@@ -45,7 +47,7 @@ class Settings(BaseSettings):
     BOT_SYNC_INTERVAL_SECONDS: int = 300
 
     # === Plotting (Optional tuning) ===
-    PLOT_DPI: int = 120
+    PLOT_DPI: int = 100
     MAP_LEGEND_ITEMS: int = 20
 
     # === Internal settings ===
@@ -53,6 +55,7 @@ class Settings(BaseSettings):
     DATE_FORMAT: str = "%Y-%m-%d %H:%M:%S"
 
 
+@lru_cache(maxsize=1)
 def load_config() -> Settings:
-    """Load configuration from .env file."""
+    """Load configuration from .env file (parsed once, then reused)."""
     return Settings()
@@ -1,7 +1,7 @@
 import os
 import sqlite3
 import logging
-from datetime import datetime
+import time
 
 DB_DIR = os.path.join(os.path.dirname(__file__), "db")
 DB_PATH = os.path.join(DB_DIR, "fail2ban.db")
@@ -39,80 +39,266 @@ class DBManager:
             raw_line TEXT
         );
         """
+        state_query = """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            inode INTEGER NOT NULL,
+            offset INTEGER NOT NULL
+        );
+        """
+        geo_query = """
+        CREATE TABLE IF NOT EXISTS geo_cache (
+            ip TEXT PRIMARY KEY,
+            country TEXT,
+            city TEXT,
+            updated_at INTEGER NOT NULL
+        );
+        """
+        # Range scans on ts and the (ts, ip) duplicate check both use the unique
+        # index (ts is its leading column); the second index serves the
+        # action = 'Ban' AND ts >= ? filters used by the stats queries.
+        index_queries = [
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_bans_ts_ip ON bans(ts, ip);",
+            "CREATE INDEX IF NOT EXISTS idx_bans_action_ts ON bans(action, ts);",
+            "CREATE INDEX IF NOT EXISTS idx_geo_cache_updated_at "
+            "ON geo_cache(updated_at);",
+        ]
         try:
             self.conn.execute(query)
+            self.conn.execute(state_query)
+            self.conn.execute(geo_query)
+            self._drop_duplicate_bans()
+            for index_query in index_queries:
+                self.conn.execute(index_query)
             self.conn.commit()
-            logger.info("✅ Ensured table 'bans' exists")
+            logger.info("✅ Ensured tables 'bans', 'sync_state' and 'geo_cache' exist")
         except Exception as e:
             logger.error("❌ Failed to create tables: %s", e)
 
-    def ban_exists(self, ts, ip):
-        """Return True if a ban with the same timestamp and IP already exists."""
-        if isinstance(ts, datetime):
-            ts_str = ts.strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            ts_str = str(ts)
+    def _drop_duplicate_bans(self):
+        """Remove duplicate (ts, ip) rows left by older versions, so the unique
+        index can be created. Runs only while that index does not exist yet.
+        """
+        cur = self.conn.execute(
+            "SELECT 1 FROM sqlite_master "
+            "WHERE type = 'index' AND name = 'idx_bans_ts_ip'"
+        )
+        if cur.fetchone():
+            return
+        cur = self.conn.execute(
+            "DELETE FROM bans "
+            "WHERE id NOT IN (SELECT MIN(id) FROM bans GROUP BY ts, ip)"
+        )
+        if cur.rowcount:
+            logger.info("🧹 Removed %d duplicate ban records", cur.rowcount)
+
+    def fetch_existing_keys(self, since=None):
+        """Return the set of stored (ts, ip) pairs, optionally since a timestamp."""
+        query = "SELECT ts, ip FROM bans"
+        params = []
+        if since:
+            query += " WHERE ts >= ?"
+            params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
+
         try:
-            cur = self.conn.execute(
-                "SELECT 1 FROM bans WHERE ts = ? AND ip = ? LIMIT 1", (ts_str, ip)
-            )
-            return cur.fetchone() is not None
+            cursor = self.conn.execute(query, params)
+            return set(cursor.fetchall())
         except Exception as e:
-            logger.error("❌ Failed to check ban existence: %s", e)
-            return False
-
-    def insert_ban(
-        self,
-        ip,
-        jail,
-        action,
-        reason=None,
-        country=None,
-        city=None,
-        raw_line=None,
-        ts=None,
-    ):
-        """Insert a ban record into the database.
-        If ts is provided (datetime or str), use it; otherwise use current time.
-        """
-        # Normalize timestamp to DB string
-        if ts is None:
-            ts_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        elif isinstance(ts, datetime):
-            ts_str = ts.strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            ts_str = str(ts)
+            logger.error("❌ Failed to fetch existing ban keys: %s", e)
+            return set()
 
+    def insert_bans_many(self, rows):
+        """Insert many ban records with one executemany and a single commit.
+        Each row is (ts, ip, jail, action, reason, country, city, raw_line).
+        Rows whose (ts, ip) already exists are ignored. Returns the number of
+        inserted rows, or None if the transaction failed.
+        """
         query = """
-        INSERT INTO bans (ts, ip, jail, action, reason, country, city, raw_line)
+        INSERT OR IGNORE INTO bans
+            (ts, ip, jail, action, reason, country, city, raw_line)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?);
         """
         try:
-            self.conn.execute(
-                query, (ts_str, ip, jail, action, reason, country, city, raw_line)
-            )
-            self.conn.commit()
-            logger.info("➕ Inserted %s for %s at %s", action, ip, ts_str)
+            with self.conn:
+                cur = self.conn.executemany(query, rows)
+            logger.info("➕ Inserted %d of %d ban records", cur.rowcount, len(rows))
+            return cur.rowcount
         except Exception as e:
-            logger.error("❌ Failed to insert ban record: %s", e)
+            logger.error("❌ Failed to insert ban records: %s", e)
+            return None
 
-    def fetch_bans(self, since=None):
-        """Fetch bans. Returns rows including raw_line for deduplication/inspection."""
-        query = "SELECT ts, ip, jail, action, reason, country, city, raw_line FROM bans"
+    def fetch_ban_ips(self, since=None):
+        """Return distinct IPs with a 'Ban' action, optionally since a timestamp."""
+        query = "SELECT DISTINCT ip FROM bans WHERE action = 'Ban'"
         params = []
         if since:
-            query += " WHERE ts >= ?"
+            query += " AND ts >= ?"
             params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
 
         try:
             cursor = self.conn.execute(query, params)
-            rows = cursor.fetchall()
-            logger.info("📊 Fetched %d ban records", len(rows))
-            return rows
+            ips = [row[0] for row in cursor.fetchall()]
+            logger.info("📊 Fetched %d distinct banned IPs", len(ips))
+            return ips
         except Exception as e:
-            logger.error("❌ Failed to fetch bans: %s", e)
+            logger.error("❌ Failed to fetch banned IPs: %s", e)
             return []
 
+    def country_counts(self, since=None):
+        """Return {country: distinct banned IPs}, optionally since a timestamp."""
+        query = (
+            "SELECT country, COUNT(DISTINCT ip) FROM bans "
+            "WHERE action = 'Ban' AND country IS NOT NULL"
+        )
+        params = []
+        if since:
+            query += " AND ts >= ?"
+            params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
+        query += " GROUP BY country"
+
+        try:
+            cursor = self.conn.execute(query, params)
+            counts = dict(cursor.fetchall())
+            logger.info("📊 Fetched ban counts for %d countries", len(counts))
+            return counts
+        except Exception as e:
+            logger.error("❌ Failed to fetch ban counts by country: %s", e)
+            return {}
+
+    def fetch_bans_bucketed(self, since, bucket_seconds):
+        """Return {bucket_index: count} of 'Ban' actions since a timestamp,
+        where bucket_index = floor((ts - since) / bucket_seconds).
+        Computed on whole seconds: julianday() is floating point and would put
+        bans exactly on a bucket boundary into the previous bucket.
+        """
+        query = """
+        SELECT
+            CAST(
+                (CAST(strftime('%s', ts) AS INTEGER)
+                    - CAST(strftime('%s', ?) AS INTEGER)) / ?
+                AS INTEGER
+            ) AS bucket,
+            COUNT(*)
+        FROM bans
+        WHERE action = 'Ban' AND ts >= ?
+        GROUP BY bucket
+        ORDER BY bucket;
+        """
+        since_str = since.strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            cursor = self.conn.execute(query, (since_str, bucket_seconds, since_str))
+            return dict(cursor.fetchall())
+        except Exception as e:
+            logger.error("❌ Failed to fetch bucketed bans: %s", e)
+            return {}
+
+    def count_bans_split(self, cur_since, prev_since):
+        """Return (current, previous) 'Ban' counts in one query.
+        current: ts >= cur_since; previous: prev_since <= ts < cur_since.
+        """
+        query = """
+        SELECT
+            COALESCE(SUM(CASE WHEN ts >= ? THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN ts < ? THEN 1 ELSE 0 END), 0)
+        FROM bans
+        WHERE action = 'Ban' AND ts >= ?;
+        """
+        cur_str = cur_since.strftime("%Y-%m-%d %H:%M:%S")
+        prev_str = prev_since.strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            current, previous = self.conn.execute(
+                query, (cur_str, cur_str, prev_str)
+            ).fetchone()
+            return current, previous
+        except Exception as e:
+            logger.error("❌ Failed to count bans for comparison: %s", e)
+            return 0, 0
+
+    def get_geo_cached(self, ips):
+        """Return {ip: (country, city)} for IPs with a known location.
+        Looks in geo_cache first, then in locations already stored on bans.
+        """
+        ips = list(ips)
+        result = {}
+        try:
+            # Stay below SQLite's default limit on bound parameters
+            for i in range(0, len(ips), 900):
+                chunk = ips[i : i + 900]
+                placeholders = ",".join("?" * len(chunk))
+                cur = self.conn.execute(
+                    f"SELECT ip, country, city FROM geo_cache "
+                    f"WHERE ip IN ({placeholders})",
+                    chunk,
+                )
+                result.update((ip, (country, city)) for ip, country, city in cur)
+
+                misses = [ip for ip in chunk if ip not in result]
+                if not misses:
+                    continue
+                placeholders = ",".join("?" * len(misses))
+                cur = self.conn.execute(
+                    f"SELECT ip, country, city FROM bans "
+                    f"WHERE ip IN ({placeholders}) "
+                    f"AND country IS NOT NULL AND country != 'Unknown' "
+                    f"GROUP BY ip",
+                    misses,
+                )
+                result.update((ip, (country, city)) for ip, country, city in cur)
+        except Exception as e:
+            logger.error("❌ Failed to read geo cache: %s", e)
+        return result
+
+    def save_geo_cached(self, rows, max_rows=None, hits=()):
+        """Store (ip, country, city) rows in geo_cache, replacing older entries.
+        IPs in hits were served from the cache and get their updated_at refreshed,
+        so with max_rows the least recently used entries beyond it are evicted.
+        """
+        now = int(time.time())
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO geo_cache (ip, country, city, updated_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(ip, country, city, now) for ip, country, city in rows],
+                )
+                self.conn.executemany(
+                    "UPDATE geo_cache SET updated_at = ? WHERE ip = ?",
+                    [(now, ip) for ip in hits],
+                )
+                if max_rows:
+                    cur = self.conn.execute(
+                        "DELETE FROM geo_cache WHERE ip IN ("
+                        "SELECT ip FROM geo_cache ORDER BY updated_at DESC "
+                        "LIMIT -1 OFFSET ?)",
+                        (max_rows,),
+                    )
+                    if cur.rowcount > 0:
+                        logger.info("🧹 Evicted %d geo cache entries", cur.rowcount)
+        except Exception as e:
+            logger.error("❌ Failed to store geo cache: %s", e)
+
+    def get_sync_state(self):
+        """Return (inode, offset) of the last processed log position, or (0, 0)."""
+        try:
+            cur = self.conn.execute("SELECT inode, offset FROM sync_state WHERE id = 1")
+            row = cur.fetchone()
+            return (row[0], row[1]) if row else (0, 0)
+        except Exception as e:
+            logger.error("❌ Failed to read sync state: %s", e)
+            return (0, 0)
+
+    def set_sync_state(self, inode, offset):
+        """Store the inode and byte offset up to which the log has been processed."""
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (id, inode, offset) "
+                    "VALUES (1, ?, ?)",
+                    (inode, offset),
+                )
+        except Exception as e:
+            logger.error("❌ Failed to store sync state: %s", e)
+
     def close(self):
         try:
             self.conn.close()
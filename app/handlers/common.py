@@ -1,55 +1,80 @@
 # app/handlers/common.py
 import logging
+from typing import Any, Dict
 
 from aiogram import F, Router
 from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandStart
 from aiogram.types import Message
-from aiogram.utils.markdown import hbold
+from aiogram.utils.markdown import hbold, hcode
 
 from app.config import Settings
-from app.services.fail2ban import get_service_status
+from app.services.fail2ban import STATUS_CACHE_TTL, get_service_status
 
 logger = logging.getLogger(__name__)
-router = Router()
-
-
-@router.message(CommandStart())
-async def handle_start(message: Message, config: Settings):
-    """Handler for the /start command."""
-    logger.info("User %d initiated /start command.", message.from_user.id)
-    text = (
-        "📊 Welcome to Fail2Ban Monitor Bot!\n\n"
-        "Available commands:\n"
-        "• /stats — View ban statistics\n"
-        "• /status — Check service state\n"
-        "• /geo — View global geo stats"
-    )
-    await message.answer(text)
-
-
-@router.message(Command("status"))
-async def handle_status(message: Message, config: Settings):
-    """Handler for the /status command."""
-    logger.info("User %d requested service status.", message.from_user.id)
-    status = get_service_status(jail_names=config.F2B_JAIL_NAMES)
-
-    running_emoji = "🟢" if status["running"] else "🔴"
-    enabled_emoji = "✅" if status["enabled"] else "❌"
-
-    text_parts = [
-        f"🛡️ {hbold('Fail2Ban Service Status')}\n\n"
-        f"Service Running: {running_emoji}\n"
-        f"Service Enabled: {enabled_emoji}\n"
-        f"Version: {status['version']}\n"
-        f"Started at: {status['start_time']}\n\n"
+
+
+def format_jail_status(jail_status: Dict[str, Any]) -> str:
+    """Formats a parsed jail status; falls back to the raw output if parsing failed."""
+    if jail_status["currently_banned"] is None:
+        return hcode(jail_status["raw"])
+
+    lines = [
+        f"Currently failed: {jail_status['currently_failed']}",
+        f"Total failed: {jail_status['total_failed']}",
+        f"Currently banned: {jail_status['currently_banned']}",
+        f"Total banned: {jail_status['total_banned']}",
     ]
+    if jail_status["file_list"]:
+        lines.append(f"File list: {hcode(jail_status['file_list'])}")
+    if jail_status["banned_ips"]:
+        lines.append(f"Banned IPs: {hcode(jail_status['banned_ips'])}")
+    return "\n".join(lines) + "\n"
+
+
+def build_router(config: Settings) -> Router:
+    """Builds the router for general commands, with settings bound via closure."""
+    router = Router()
+
+    @router.message(CommandStart())
+    async def handle_start(message: Message):
+        """Handler for the /start command."""
+        logger.info("User %d initiated /start command.", message.from_user.id)
+        text = (
+            "📊 Welcome to Fail2Ban Monitor Bot!\n\n"
+            "Available commands:\n"
+            "• /stats — View ban statistics\n"
+            "• /status — Check service state\n"
+            "• /geo — View global geo stats"
+        )
+        await message.answer(text)
+
+    @router.message(Command("status"))
+    async def handle_status(message: Message):
+        """Handler for the /status command."""
+        logger.info("User %d requested service status.", message.from_user.id)
+        status = await get_service_status(
+            jail_names=config.F2B_JAIL_NAMES, cache_ttl=STATUS_CACHE_TTL
+        )
+
+        running_emoji = "🟢" if status["running"] else "🔴"
+        enabled_emoji = "✅" if status["enabled"] else "❌"
+
+        text_parts = [
+            f"🛡️ {hbold('Fail2Ban Service Status')}\n\n"
+            f"Service Running: {running_emoji}\n"
+            f"Service Enabled: {enabled_emoji}\n"
+            f"Version: {status['version']}\n"
+            f"Started at: {status['start_time']}\n\n"
+        ]
+
+        if status["jail_statuses"]:
+            for jail_name, jail_status in status["jail_statuses"].items():
+                text_parts.append(f"{hbold(f'Status for jail [{jail_name}]')}:")
+                text_parts.append(format_jail_status(jail_status))
+        else:
+            text_parts.append("No jails configured to monitor.")
 
-    if status["jail_statuses"]:
-        for jail_name, jail_status in status["jail_statuses"].items():
-            text_parts.append(f"{hbold(f'Status for jail [{jail_name}]')}:")
-            text_parts.append(f"<code>\n{jail_status}\n</code>")
-    else:
-        text_parts.append("No jails configured to monitor.")
+        await message.answer("\n".join(text_parts), parse_mode=ParseMode.HTML)
 
-    await message.answer("\n".join(text_parts), parse_mode=ParseMode.HTML)
+    return router
@@ -1,6 +1,9 @@
 # app/handlers/stats.py
+import asyncio
 import logging
+import os
 from pathlib import Path
+from typing import Dict, Tuple
 
 from aiogram import F, Router
 from aiogram.filters import Command
@@ -14,7 +17,10 @@ from app.keyboards.inline import (
     get_period_selection_keyboard,
     get_stats_keyboard,
 )
-from app.services.fail2ban import count_bans_in_period, extract_banned_ips
+from app.services.fail2ban import (
+    count_bans_by_country,
+    count_bans_current_and_previous,
+)
 from app.utils.plotting import (
     generate_comparison_plot,
     generate_single_period_plot,
@@ -22,7 +28,9 @@ from app.utils.plotting import (
 )
 
 logger = logging.getLogger(__name__)
-router = Router()
+
+# plot path -> (mtime_ns, Telegram file_id) of the last upload of that file
+_sent_photo_ids: Dict[str, Tuple[int, str]] = {}
 
 
 async def safe_delete_message(query: CallbackQuery):
@@ -34,163 +42,202 @@ async def safe_delete_message(query: CallbackQuery):
         logger.debug("Failed to delete message %d: %s", query.message.message_id, e)
 
 
-@router.message(Command("stats"))
-async def handle_stats_command(message: Message):
-    """Handler for the /stats command, shows period selection."""
-    logger.info("User %d opened stats menu with /stats command.", message.from_user.id)
-    await message.answer(
-        "📊 Select period:", reply_markup=get_period_selection_keyboard()
-    )
+async def answer_plot(message: Message, plot_path: str, **kwargs) -> None:
+    """
+    Sends a plot as a photo reply. If the same file (by path and mtime) was sent
+    before, Telegram's file_id is reused instead of uploading it again.
+    """
+    mtime_ns = os.stat(plot_path).st_mtime_ns
+    cached = _sent_photo_ids.get(plot_path)
+    if cached and cached[0] == mtime_ns:
+        photo = cached[1]
+    else:
+        photo = FSInputFile(plot_path)
 
+    sent = await message.answer_photo(photo=photo, **kwargs)
+    if sent.photo:
+        _sent_photo_ids[plot_path] = (mtime_ns, sent.photo[-1].file_id)
 
-@router.callback_query(F.data == "stats_menu")
-async def handle_stats_menu_callback(query: CallbackQuery):
-    """Handler for 'stats_menu' callback, returns to period selection."""
-    logger.info("User %d returned to stats menu.", query.from_user.id)
-    await query.message.edit_text(
-        "📊 Select period:", reply_markup=get_period_selection_keyboard()
-    )
-    await query.answer()
 
+def build_router(config: Settings) -> Router:
+    """Builds the router for statistics commands, with settings bound via closure."""
+    router = Router()
 
-@router.message(Command("geo"))
-async def handle_geo_command(message: Message, db_manager: DBManager, config: Settings):
-    """Handler for /geo command, shows global map of all-time bans."""
-    logger.info("User %d requested global geo stats.", message.from_user.id)
-    await message.answer("🗺️ Generating global map, this may take a moment...")
+    @router.message(Command("stats"))
+    async def handle_stats_command(message: Message):
+        """Handler for the /stats command, shows period selection."""
+        logger.info(
+            "User %d opened stats menu with /stats command.", message.from_user.id
+        )
+        await message.answer(
+            "📊 Select period:", reply_markup=get_period_selection_keyboard()
+        )
 
-    ips = extract_banned_ips(db_manager, config)
-    if not ips:
-        await message.answer("No banned IPs found to generate a map.")
-        return
+    @router.callback_query(F.data == "stats_menu")
+    async def handle_stats_menu_callback(query: CallbackQuery):
+        """Handler for 'stats_menu' callback, returns to period selection."""
+        logger.info("User %d returned to stats menu.", query.from_user.id)
+        await query.message.edit_text(
+            "📊 Select period:", reply_markup=get_period_selection_keyboard()
+        )
+        await query.answer()
 
-    title = "Global Distribution of Banned IPs — All Time"
-    plot_path = generate_world_map_plot(ips, title, config)
+    @router.message(Command("geo"))
+    async def handle_geo_command(message: Message, db_manager: DBManager):
+        """Handler for /geo command, shows global map of all-time bans."""
+        logger.info("User %d requested global geo stats.", message.from_user.id)
+        await message.answer("🗺️ Generating global map, this may take a moment...")
 
-    if plot_path and Path(plot_path).exists():
-        await message.answer_photo(
-            photo=FSInputFile(plot_path),
-            caption=f"🌍 {title}",
+        # File scans, GeoIP lookups and cartopy rendering block; keep them off the loop
+        country_counts = await asyncio.to_thread(
+            count_bans_by_country, db_manager, config
         )
-    else:
-        await message.answer("❌ Failed to generate the world map.")
-
+        if not country_counts:
+            await message.answer("No banned IPs found to generate a map.")
+            return
 
-@router.callback_query(PeriodCallback.filter(F.action == "show"))
-async def handle_period_stats(
-    query: CallbackQuery,
-    callback_data: PeriodCallback,
-    db_manager: DBManager,
-    config: Settings,
-):
-    """Handler to show stats for a selected period."""
-    period_key = callback_data.period_key
-    hours, label = PERIODS[period_key]
-    logger.info("User %d requested stats for period: %s", query.from_user.id, label)
+        title = "Global Distribution of Banned IPs — All Time"
+        plot_path = await asyncio.to_thread(
+            generate_world_map_plot, country_counts, title, config
+        )
 
-    await query.answer(f"Generating stats for {label}...")
+        if plot_path and Path(plot_path).exists():
+            await answer_plot(
+                message,
+                plot_path,
+                caption=f"🌍 {title}",
+            )
+        else:
+            await message.answer("❌ Failed to generate the world map.")
+
+    @router.callback_query(PeriodCallback.filter(F.action == "show"))
+    async def handle_period_stats(
+        query: CallbackQuery,
+        callback_data: PeriodCallback,
+        db_manager: DBManager,
+    ):
+        """Handler to show stats for a selected period."""
+        period_key = callback_data.period_key
+        hours, label = PERIODS[period_key]
+        logger.info("User %d requested stats for period: %s", query.from_user.id, label)
+
+        await query.answer(f"Generating stats for {label}...")
+
+        # The plot's buckets already cover the whole period; reuse their total
+        plot_path, current_bans = await asyncio.to_thread(
+            generate_single_period_plot, db_manager, config, hours, label
+        )
 
-    current_bans = count_bans_in_period(db_manager, config, hours)
-    plot_path = generate_single_period_plot(db_manager, config, hours, label)
+        caption = f"Bans in the last {label.lower()}:\n\nTotal: {current_bans}"
+
+        if plot_path and Path(plot_path).exists():
+            await answer_plot(
+                query.message,
+                plot_path,
+                caption=caption,
+                reply_markup=get_stats_keyboard(period_key),
+            )
+            await safe_delete_message(query)
+        else:
+            await query.message.edit_text(
+                f"{caption}\n\n(Could not generate plot)",
+                reply_markup=get_stats_keyboard(period_key),
+            )
+
+    @router.callback_query(PeriodCallback.filter(F.action == "compare"))
+    async def handle_comparison_stats(
+        query: CallbackQuery,
+        callback_data: PeriodCallback,
+        db_manager: DBManager,
+    ):
+        """Handler to compare current period with the previous one."""
+        period_key = callback_data.period_key
+        hours, label = PERIODS[period_key]
+        logger.info(
+            "User %d requested comparison for period: %s", query.from_user.id, label
+        )
 
-    caption = f"Bans in the last {label.lower()}:\n\nTotal: {current_bans}"
+        await query.answer(f"Generating comparison for {label}...")
 
-    if plot_path and Path(plot_path).exists():
-        await query.message.answer_photo(
-            photo=FSInputFile(plot_path),
-            caption=caption,
-            reply_markup=get_stats_keyboard(period_key),
+        current_bans, previous_bans = await asyncio.to_thread(
+            count_bans_current_and_previous, db_manager, config, hours
         )
-        await safe_delete_message(query)
-    else:
-        await query.message.edit_text(
-            f"{caption}\n\n(Could not generate plot)",
-            reply_markup=get_stats_keyboard(period_key),
+
+        diff = current_bans - previous_bans
+        trend = "↗️" if diff > 0 else "↘️" if diff < 0 else "➡️"
+        change = abs(diff)
+        percent_change = (
+            (change / previous_bans * 100)
+            if previous_bans > 0
+            else (100.0 if current_bans > 0 else 0.0)
         )
 
+        caption = (
+            f"📊 Comparison: {label} vs Previous {label}\n\n"
+            f"📌 Current: {current_bans}\n"
+            f"📌 Previous: {previous_bans}\n"
+            f"📈 Change: {trend} {change} ({percent_change:.1f}%)"
+        )
 
-@router.callback_query(PeriodCallback.filter(F.action == "compare"))
-async def handle_comparison_stats(
-    query: CallbackQuery,
-    callback_data: PeriodCallback,
-    db_manager: DBManager,
-    config: Settings,
-):
-    """Handler to compare current period with the previous one."""
-    period_key = callback_data.period_key
-    hours, label = PERIODS[period_key]
-    logger.info(
-        "User %d requested comparison for period: %s", query.from_user.id, label
-    )
-
-    await query.answer(f"Generating comparison for {label}...")
-
-    current_bans = count_bans_in_period(db_manager, config, hours)
-    previous_bans = count_bans_in_period(db_manager, config, 2 * hours) - current_bans
-
-    diff = current_bans - previous_bans
-    trend = "↗️" if diff > 0 else "↘️" if diff < 0 else "➡️"
-    change = abs(diff)
-    percent_change = (
-        (change / previous_bans * 100)
-        if previous_bans > 0
-        else (100.0 if current_bans > 0 else 0.0)
-    )
-
-    caption = (
-        f"📊 Comparison: {label} vs Previous {label}\n\n"
-        f"📌 Current: {current_bans}\n"
-        f"📌 Previous: {previous_bans}\n"
-        f"📈 Change: {trend} {change} ({percent_change:.1f}%)"
-    )
-
-    plot_path = generate_comparison_plot(current_bans, previous_bans, label, config)
-
-    if plot_path and Path(plot_path).exists():
-        await query.message.answer_photo(
-            photo=FSInputFile(plot_path),
-            caption=caption,
-            reply_markup=get_period_selection_keyboard(back_button=True),
+        plot_path = await asyncio.to_thread(
+            generate_comparison_plot, current_bans, previous_bans, label, config
         )
-        await safe_delete_message(query)
-    else:
-        await query.message.edit_text(
-            caption,
-            reply_markup=get_period_selection_keyboard(back_button=True),
+
+        if plot_path and Path(plot_path).exists():
+            await answer_plot(
+                query.message,
+                plot_path,
+                caption=caption,
+                reply_markup=get_period_selection_keyboard(back_button=True),
+            )
+            await safe_delete_message(query)
+        else:
+            await query.message.edit_text(
+                caption,
+                reply_markup=get_period_selection_keyboard(back_button=True),
+            )
+
+    @router.callback_query(PeriodCallback.filter(F.action == "geo"))
+    async def handle_period_geo_stats(
+        query: CallbackQuery,
+        callback_data: PeriodCallback,
+        db_manager: DBManager,
+    ):
+        """Handler for showing geo map for a specific period."""
+        period_key = callback_data.period_key
+        hours, label = PERIODS[period_key]
+        logger.info(
+            "User %d requested geo stats for period: %s", query.from_user.id, label
         )
 
+        await query.answer(f"Generating map for {label}...")
 
-@router.callback_query(PeriodCallback.filter(F.action == "geo"))
-async def handle_period_geo_stats(
-    query: CallbackQuery,
-    callback_data: PeriodCallback,
-    db_manager: DBManager,
-    config: Settings,
-):
-    """Handler for showing geo map for a specific period."""
-    period_key = callback_data.period_key
-    hours, label = PERIODS[period_key]
-    logger.info("User %d requested geo stats for period: %s", query.from_user.id, label)
-
-    await query.answer(f"Generating map for {label}...")
-
-    ips = extract_banned_ips(db_manager, config, since_hours=hours)
-    if not ips:
-        await query.message.answer(f"No banned IPs found in the last {label.lower()}.")
-        return
-
-    title = f"Global Distribution of Banned IPs — Last {label}"
-    plot_path = generate_world_map_plot(ips, title, config)
-
-    if plot_path and Path(plot_path).exists():
-        await query.message.answer_photo(
-            photo=FSInputFile(plot_path),
-            caption=f"🌍 {title}",
-            reply_markup=get_period_selection_keyboard(back_button=True),
+        country_counts = await asyncio.to_thread(
+            count_bans_by_country, db_manager, config, since_hours=hours
         )
-        await safe_delete_message(query)
-    else:
-        await query.message.edit_text(
-            "❌ Failed to generate the world map for this period.",
-            reply_markup=get_period_selection_keyboard(back_button=True),
+        if not country_counts:
+            await query.message.answer(
+                f"No banned IPs found in the last {label.lower()}."
+            )
+            return
+
+        title = f"Global Distribution of Banned IPs — Last {label}"
+        plot_path = await asyncio.to_thread(
+            generate_world_map_plot, country_counts, title, config
         )
+
+        if plot_path and Path(plot_path).exists():
+            await answer_plot(
+                query.message,
+                plot_path,
+                caption=f"🌍 {title}",
+                reply_markup=get_period_selection_keyboard(back_button=True),
+            )
+            await safe_delete_message(query)
+        else:
+            await query.message.edit_text(
+                "❌ Failed to generate the world map for this period.",
+                reply_markup=get_period_selection_keyboard(back_button=True),
+            )
+
+    return router
@@ -14,8 +14,8 @@ PERIODS = {
 }
 
 
-def get_period_selection_keyboard(back_button: bool = False) -> InlineKeyboardMarkup:
-    """Returns a keyboard for selecting a time period."""
+def _build_period_selection_keyboard(back_button: bool) -> InlineKeyboardMarkup:
+    """Builds the keyboard for selecting a time period."""
     builder = InlineKeyboardBuilder()
     for key, (_, label) in PERIODS.items():
         builder.button(
@@ -30,8 +30,8 @@ def get_period_selection_keyboard(back_button: bool = False) -> InlineKeyboardMa
     return builder.as_markup()
 
 
-def get_stats_keyboard(period_key: str) -> InlineKeyboardMarkup:
-    """Returns a keyboard with actions for a selected period."""
+def _build_stats_keyboard(period_key: str) -> InlineKeyboardMarkup:
+    """Builds the keyboard with actions for a selected period."""
     builder = InlineKeyboardBuilder()
     label = PERIODS[period_key][1].lower()
 
@@ -46,3 +46,22 @@ def get_stats_keyboard(period_key: str) -> InlineKeyboardMarkup:
     builder.button(text="📅 Select another period", callback_data="stats_menu")
     builder.adjust(1)  # 1 button per row
     return builder.as_markup()
+
+
+# Markups are frozen pydantic models and depend only on PERIODS, so they are
+# built once at import and shared by every handler call.
+_PERIOD_SELECTION_KEYBOARDS = {
+    back_button: _build_period_selection_keyboard(back_button)
+    for back_button in (False, True)
+}
+_STATS_KEYBOARDS = {key: _build_stats_keyboard(key) for key in PERIODS}
+
+
+def get_period_selection_keyboard(back_button: bool = False) -> InlineKeyboardMarkup:
+    """Returns a keyboard for selecting a time period."""
+    return _PERIOD_SELECTION_KEYBOARDS[back_button]
+
+
+def get_stats_keyboard(period_key: str) -> InlineKeyboardMarkup:
+    """Returns a keyboard with actions for a selected period."""
+    return _STATS_KEYBOARDS[period_key]
@@ -1,6 +1,6 @@
 # app/middlewares/admin.py
 import logging
-from typing import Any, Awaitable, Callable, Dict, List
+from typing import Any, Awaitable, Callable, Dict, Iterable
 
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, User
@@ -13,9 +13,10 @@ class AdminMiddleware(BaseMiddleware):
     Middleware to check if the user is in the admin list.
     """
 
-    def __init__(self, admin_ids: List[int]):
+    def __init__(self, admin_ids: Iterable[int]):
         super().__init__()
-        self.admin_ids = admin_ids
+        # Checked on every update; a frozenset makes the lookup O(1)
+        self.admin_ids = frozenset(admin_ids)
 
     async def __call__(
         self,
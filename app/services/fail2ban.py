@@ -1,38 +1,197 @@
 # app/services/fail2ban.py
 import asyncio
 import logging
+import mmap
+import os
 import re
-import subprocess
+import time
+from bisect import bisect_left
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 from dateutil import parser
 
 from app.config import Settings
 from app.db_manager import DBManager
-from app.services.geoip import get_geo_info
+from app.services.geoip import get_geo_info_many
 
 logger = logging.getLogger(__name__)
 
 
-def parse_log_timestamp(log_line: str) -> Optional[datetime]:
-    """Parses a timestamp from a log line, trying multiple formats."""
-    # ISO format with optional milliseconds: 2023-10-27 10:30:00,123
-    iso_match = re.search(r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?:,\d+)?", log_line)
-    if iso_match:
-        try:
-            return datetime.strptime(iso_match.group(1), "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            logger.debug("Failed to parse timestamp (ISO basic) from: %s", log_line)
+# Whole Ban/Unban line: timestamp, optional "[jail] ", optional "Restore ", action, IP.
+# Matched against raw bytes so log lines never need to be decoded as a whole, and
+# anchored at line starts so a whole buffer is scanned with one finditer() call.
+# The lookahead rejects lines without an action word before the optional jail and
+# "Restore" groups are tried at every position, which is where most time went.
+# Every variable-width part is bounded and none can cross a newline, which keeps
+# backtracking to a small, fixed amount per line even on malformed input.
+_LINE_RE = re.compile(
+    rb"(?m)^(?=[^\n]{0,256}?(?:Ban|Unban)[ \t])"
+    rb"(?P<ts>\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2})"
+    rb"[^\n]{0,256}?(?:\[(?P<jail>[^\]\n]{1,64})\][ \t]+)?(?:Restore[ \t]+)?"
+    rb"(?P<action>Ban|Unban)[ \t]+"
+    rb"(?P<ip>[0-9]{1,3}(?:\.[0-9]{1,3}){3}|[0-9a-fA-F:]{2,39})"
+)
+
+# Pieces of a 'Ban' line, matched at positions found by a literal search for " Ban ".
+# fail2ban always writes "... [jail] Ban <ip>" (or "Restore Ban") with single spaces.
+_BAN_TS_RE = re.compile(rb"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
+_BAN_IP_RE = re.compile(rb"[0-9]{1,3}(?:\.[0-9]{1,3}){3}|[0-9a-fA-F:]{2,39}")
+
+
+# Bans arrive in bursts that share the same second, so most calls are cache hits
+@lru_cache(maxsize=256)
+def _parse_ts(raw: bytes) -> Optional[datetime]:
+    """Converts a raw "YYYY-MM-DD HH:MM:SS" (or "T"-separated) timestamp."""
+    # fromisoformat is implemented in C and accepts both " " and "T" separators
+    try:
+        return datetime.fromisoformat(raw.decode("ascii"))
+    except ValueError:
+        return None
 
-    # ISO 8601 format: 2023-10-27T10:30:00Z
-    iso8601_match = re.search(r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})Z?", log_line)
-    if iso8601_match:
-        try:
-            return datetime.strptime(iso8601_match.group(1), "%Y-%m-%dT%H:%M:%S")
-        except ValueError:
-            logger.debug("Failed to parse timestamp (ISO8601) from: %s", log_line)
-    return None
+
+def _ts_key(dt: datetime) -> bytes:
+    """
+    Formats a cutoff as b"YYYY-MM-DD HH:MM:SS". Raw log timestamps in this fixed
+    layout compare in time order as plain bytes, so filters need not parse them.
+    """
+    return dt.strftime("%Y-%m-%d %H:%M:%S").encode("ascii")
+
+
+def _raw_ts_key(raw: bytes) -> bytes:
+    """Normalizes a raw log timestamp ("T" or " " separated) for comparison."""
+    return raw.replace(b"T", b" ")
+
+
+def _parse_match_ts(m: re.Match) -> Optional[datetime]:
+    """Converts the 'ts' group of a _LINE_RE match into a datetime."""
+    return _parse_ts(m.group("ts"))
+
+
+def _iter_blocks_reverse(path: Path, blocksize: int = 1 << 20) -> Iterator[bytes]:
+    """
+    Yields chunks of whole lines from the end of a file towards its start.
+    Lines inside a chunk keep their file order, so a chunk can be matched with
+    the line-anchored patterns in one call.
+    """
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while pos > 0:
+            read_size = min(blocksize, pos)
+            pos -= read_size
+            f.seek(pos)
+            chunk = f.read(read_size) + remainder
+            # The first line may continue in the previous block; carry it over
+            cut = chunk.find(b"\n") + 1
+            if not cut:
+                remainder = chunk
+                continue
+            remainder = chunk[:cut]
+            yield chunk[cut:]
+        if remainder:
+            yield remainder
+
+
+def _find_bans(buf) -> List[Tuple[bytes, bytes]]:
+    """
+    Returns (timestamp, ip) byte pairs for every 'Ban' line in a bytes-like
+    buffer (bytes or mmap), in order. Only lines containing " Ban " are looked
+    at: the search for that literal runs in C, and most log lines lack it.
+    """
+    bans = []
+    find, rfind = buf.find, buf.rfind
+    pos = 0
+    while True:
+        idx = find(b" Ban ", pos)
+        if idx < 0:
+            return bans
+        line_start = rfind(b"\n", 0, idx) + 1
+        pos = find(b"\n", idx)
+        if pos < 0:
+            pos = len(buf)
+        ts = _BAN_TS_RE.match(buf, line_start)
+        ip = _BAN_IP_RE.match(buf, idx + 5, pos)
+        if ts and ip:
+            bans.append((ts.group(), ip.group()))
+
+
+def _tail_bans(path: Path, since_key: bytes) -> List[Tuple[bytes, bytes]]:
+    """
+    Returns (timestamp, ip) byte pairs of 'Ban' lines at or after `since_key`,
+    oldest first, reading the log backwards only as far as the first older ban.
+    """
+    blocks = []
+    for block in _iter_blocks_reverse(path):
+        pairs = _find_bans(block)
+        blocks.append(pairs)
+        if pairs and _raw_ts_key(pairs[0][0]) < since_key:
+            break  # Logs are ordered by time
+    return [
+        (raw_ts, raw_ip)
+        for pairs in reversed(blocks)
+        for raw_ts, raw_ip in pairs
+        if _raw_ts_key(raw_ts) >= since_key
+    ]
+
+
+def _scan_bans(path: Path) -> List[Tuple[bytes, bytes]]:
+    """
+    Returns (timestamp, ip) byte pairs for every 'Ban' line in a file, in order.
+    The file is memory-mapped and searched in place, without reading it into
+    Python objects line by line.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []  # mmap cannot map an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # The scan runs front to back: ask for aggressive readahead (Linux)
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            return _find_bans(mm)
+
+
+# log path -> ((inode, mtime_ns, size), cutoff covered or None for the whole file,
+#              [(normalized timestamp, ip)] oldest first)
+_log_scan_cache: Dict[
+    Path, Tuple[Tuple[int, int, int], Optional[bytes], List[Tuple[bytes, bytes]]]
+] = {}
+
+
+def _scan_log_bans(
+    log_file: Path, since: Optional[datetime] = None
+) -> List[Tuple[bytes, bytes]]:
+    """
+    Returns (timestamp, ip) byte pairs of 'Ban' lines at or after `since` (all
+    bans if None), oldest first, with timestamps normalized by _raw_ts_key.
+    The scanned range is kept until the file changes, so the log fallbacks of
+    one interaction (plot, counts, map) share a single read of the file.
+    """
+    since_key = _ts_key(since) if since else None
+    st = os.stat(log_file)
+    stat_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    cached = _log_scan_cache.get(log_file)
+    if (
+        cached
+        and cached[0] == stat_key
+        and (cached[1] is None or (since_key is not None and since_key >= cached[1]))
+    ):
+        bans = cached[2]
+    else:
+        if since_key is None:
+            pairs = _scan_bans(log_file)
+        else:
+            pairs = _tail_bans(log_file, since_key)
+        bans = [(_raw_ts_key(raw_ts), raw_ip) for raw_ts, raw_ip in pairs]
+        _log_scan_cache[log_file] = (stat_key, since_key, bans)
+
+    if since_key is None:
+        return bans
+    return bans[bisect_left(bans, (since_key,)) :]
 
 
 def extract_banned_ips(
@@ -46,82 +205,246 @@ def extract_banned_ips(
 
     # Primary method: Use the database
     if db_manager:
-        rows = db_manager.fetch_bans(since=since_dt)
-        # rows format: (ts, ip, jail, action, reason, country, city, raw_line)
-        ips = [r[1] for r in rows if r[3] and "ban" in r[3].lower()]
-        # De-duplicate while preserving order
-        return list(dict.fromkeys(ips))
+        return db_manager.fetch_ban_ips(since=since_dt)
 
     # Fallback method: Parse the log file
     logger.warning(
         "DBManager not available. Falling back to log file parsing for IP extraction."
     )
-    ips = []
+    unique_ips: Dict[bytes, None] = {}
     try:
-        with open(config.LOG_FILE, "r") as f:
-            for line in f:
-                if "Ban " not in line and "ban " not in line:
-                    continue
-                m = re.search(
-                    r"Ban ([0-9]{1,3}(?:\.[0-9]{1,3}){3}|[0-9a-fA-F:]+)", line
-                )
-                if not m:
-                    continue
-
-                ip = m.group(1)
-                if since_dt:
-                    ts = parse_log_timestamp(line)
-                    if not ts or ts < since_dt:
-                        continue
-                ips.append(ip)
+        # Deduplicate the raw bytes first so only unique IPs get decoded
+        unique_ips = dict.fromkeys(
+            raw_ip for _, raw_ip in _scan_log_bans(config.LOG_FILE, since_dt)
+        )
     except Exception as e:
         logger.error("Error reading banned IPs from log file: %s", e)
 
-    return list(dict.fromkeys(ips))
+    return [raw_ip.decode("ascii") for raw_ip in unique_ips]
 
 
-def count_bans_in_period(db_manager: DBManager, config: Settings, hours: int) -> int:
+def count_bans_by_country(
+    db_manager: DBManager, config: Settings, since_hours: int = None
+) -> Dict[str, int]:
     """
-    Counts 'Ban' actions in the last `hours`. Prefers DB; falls back to log parsing.
+    Counts distinct banned IPs per country.
+    Uses the countries stored in the DB; falls back to GeoIP lookups of log IPs.
     """
-    since_dt = datetime.now() - timedelta(hours=hours)
+    if db_manager:
+        since_dt = (
+            datetime.now() - timedelta(hours=since_hours) if since_hours else None
+        )
+        return db_manager.country_counts(since=since_dt)
 
-    # Primary method: Use the database
+    ips = extract_banned_ips(db_manager, config, since_hours=since_hours)
+    geo_map = get_geo_info_many(ips, config)
+    return dict(Counter(geo_map[ip]["country"] for ip in ips))
+
+
+def read_ban_timestamps(log_file: Path, since: datetime) -> List[datetime]:
+    """
+    Returns timestamps of 'Ban' actions in the log file at or after `since`,
+    newest first. Only the tail of the log back to `since` is read.
+    """
+    timestamps = []
+    for raw_ts, _ in reversed(_scan_log_bans(log_file, since)):
+        ts = _parse_ts(raw_ts)
+        if ts:
+            timestamps.append(ts)
+    return timestamps
+
+
+def _count_log_bans_split(
+    log_file: Path, cur_since: datetime, prev_since: datetime
+) -> Tuple[int, int]:
+    """
+    Counts 'Ban' lines at/after `cur_since` and in [`prev_since`, `cur_since`)
+    with one backwards pass over the tail of the log.
+    """
+    bans = _scan_log_bans(log_file, prev_since)
+    previous = bisect_left(bans, (_ts_key(cur_since),))
+    return len(bans) - previous, previous
+
+
+# /status requests within this window share one refresh; short enough that a
+# service start/stop shows up almost immediately
+STATUS_CACHE_TTL = 5.0
+# Repeated clicks within this window reuse the previous counts
+COUNT_CACHE_TTL = 60.0
+# hours -> (expires_at, (current, previous))
+_count_cache: Dict[int, Tuple[float, Tuple[int, int]]] = {}
+
+
+def count_bans_current_and_previous(
+    db_manager: DBManager, config: Settings, hours: int
+) -> Tuple[int, int]:
+    """
+    Counts bans in the last `hours` and in the `hours` before that.
+    Uses a single DB query when available; falls back to log parsing.
+    Results are reused for COUNT_CACHE_TTL seconds.
+    """
+    cached = _count_cache.get(hours)
+    if cached and cached[0] > time.monotonic():
+        logger.debug("Returning cached ban counts for %d hours", hours)
+        return cached[1]
+
+    now = datetime.now()
     if db_manager:
-        rows = db_manager.fetch_bans(since=since_dt)
-        count = sum(1 for r in rows if r[3] and "ban" in r[3].lower())
-        logger.info("Counted %d bans in last %d hours (from DB)", count, hours)
-        return count
+        current, previous = db_manager.count_bans_split(
+            cur_since=now - timedelta(hours=hours),
+            prev_since=now - timedelta(hours=2 * hours),
+        )
+        logger.info(
+            "Counted %d current / %d previous bans for %d hours (from DB)",
+            current,
+            previous,
+            hours,
+        )
+    else:
+        logger.warning(
+            "DBManager not available. Falling back to log file parsing for ban count."
+        )
+        current = previous = 0
+        try:
+            current, previous = _count_log_bans_split(
+                config.LOG_FILE,
+                now - timedelta(hours=hours),
+                now - timedelta(hours=2 * hours),
+            )
+        except Exception as e:
+            logger.error("Error reading log file %s: %s", config.LOG_FILE, e)
+        logger.info(
+            "Counted %d current / %d previous bans for %d hours (from log file)",
+            current,
+            previous,
+            hours,
+        )
 
-    # Fallback method: Parse the log file
-    logger.warning(
-        "DBManager not available. Falling back to log file parsing for ban count."
-    )
-    count = 0
+    _count_cache[hours] = (time.monotonic() + COUNT_CACHE_TTL, (current, previous))
+    return current, previous
+
+
+# "|  |- Currently failed:\t0" -> ("Currently failed", "0")
+_JAIL_FIELD_RE = re.compile(r"^[\s|`-]*(?P<key>[A-Za-z ]+?):[ \t]*(?P<value>.*)$", re.M)
+
+_JAIL_INT_FIELDS = {
+    "Currently failed": "currently_failed",
+    "Total failed": "total_failed",
+    "Currently banned": "currently_banned",
+    "Total banned": "total_banned",
+}
+_JAIL_STR_FIELDS = {
+    "File list": "file_list",
+    "Banned IP list": "banned_ips",
+}
+
+# jail names -> (expires_at, status)
+_status_cache: Dict[Tuple[str, ...], Tuple[float, Dict[str, Any]]] = {}
+_status_lock = asyncio.Lock()
+# fail2ban-client version; it only changes on upgrade, so it is fetched once
+_fail2ban_version: Optional[str] = None
+
+
+def _parse_jail_status(text: str) -> Dict[str, Any]:
+    """
+    Parses `fail2ban-client status <jail>` output into structured fields.
+    Fields that are missing (e.g. the command failed) are None; the original
+    output is always kept under 'raw'.
+    """
+    parsed: Dict[str, Any] = {key: None for key in _JAIL_INT_FIELDS.values()}
+    parsed.update({key: None for key in _JAIL_STR_FIELDS.values()})
+    parsed["raw"] = text
+
+    for m in _JAIL_FIELD_RE.finditer(text):
+        key, value = m.group("key").strip(), m.group("value").strip()
+        if key in _JAIL_INT_FIELDS and value.isdigit():
+            parsed[_JAIL_INT_FIELDS[key]] = int(value)
+        elif key in _JAIL_STR_FIELDS:
+            parsed[_JAIL_STR_FIELDS[key]] = value
+    return parsed
+
+
+async def _run_command(command: List[str]) -> str:
+    """Runs a command and returns its stdout, or stderr/an error message on failure."""
     try:
-        with open(config.LOG_FILE, "r") as f:
-            lines = f.readlines()
-        for line in reversed(lines):
-            if "Ban " not in line and "ban " not in line:
-                continue
-            ts = parse_log_timestamp(line)
-            if not ts:
-                continue
-            if ts >= since_dt:
-                count += 1
-            else:
-                break  # Optimization: logs are ordered by time
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+    except FileNotFoundError:
+        logger.error("Command not found: %s", command[0])
+        return f"Error: command '{command[0]}' not found."
     except Exception as e:
-        logger.error("Error reading log file %s: %s", config.LOG_FILE, e)
+        logger.error("Failed to run command '%s': %s", " ".join(command), e)
+        return "Error: failed to execute command."
+
+    if process.returncode != 0:
+        # Return stderr if the command failed, as this is often more informative.
+        return (
+            stderr.decode(errors="replace").strip()
+            if stderr
+            else "Command failed with no output."
+        )
+    return stdout.decode(errors="replace").strip()
+
+
+def _fast_parse_systemd_ts(ts_str: str) -> Optional[datetime]:
+    """
+    Parses a systemd timestamp such as "Mon 2023-10-27 10:30:00 UTC".
+    Returns None if the value cannot be parsed.
+    """
+    # Fixed layout: slice out date and time instead of matching the weekday/zone
+    parts = ts_str.split(" ", 2)
+    if len(parts) == 3 and len(parts[1]) == 10 and parts[2][8:9] in ("", " "):
+        try:
+            return datetime.fromisoformat(f"{parts[1]} {parts[2][:8]}")
+        except ValueError:
+            pass
+    # Unusual layout; fall back to dateutil
+    try:
+        return parser.parse(ts_str)
+    except (ValueError, OverflowError):
+        return None
+
+
+def _cached_status(cache_key: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    cached = _status_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
 
-    logger.info("Counted %d bans in last %d hours (from log file)", count, hours)
-    return count
+async def get_service_status(
+    jail_names: List[str], cache_ttl: float = 0
+) -> Dict[str, Any]:
+    """
+    Retrieves fail2ban service information, including status for multiple jails.
+    Results are reused for `cache_ttl` seconds.
+    """
+    if cache_ttl <= 0:
+        return await _collect_service_status(jail_names)
+
+    cache_key = tuple(jail_names)
+    status = _cached_status(cache_key)
+    if status is not None:
+        logger.debug("Returning cached fail2ban service status.")
+        return status
+
+    # Concurrent requests wait for a single refresh instead of each spawning
+    # their own set of subprocesses
+    async with _status_lock:
+        status = _cached_status(cache_key)
+        if status is None:
+            status = await _collect_service_status(jail_names)
+            _status_cache[cache_key] = (time.monotonic() + cache_ttl, status)
+    return status
 
 
-def get_service_status(
-    jail_names: List[str],
-) -> Dict[str, any]:  # Изменился входной параметр
-    """Retrieves fail2ban service information, including status for multiple jails."""
+async def _collect_service_status(jail_names: List[str]) -> Dict[str, Any]:
+    """Runs the status commands and assembles the service status dict."""
+    global _fail2ban_version
     status = {
         "running": False,
         "enabled": False,
@@ -130,53 +453,54 @@ def get_service_status(
         "jail_statuses": {},
     }
 
-    def run_command(command: list) -> str:
-        try:
-            result = subprocess.run(
-                command, capture_output=True, text=True, check=False
-            )
-            if result.returncode != 0:
-                # Return stderr if the command failed, as this is often more informative.
-                return (
-                    result.stderr.strip()
-                    if result.stderr
-                    else "Command failed with no output."
-                )
-            return result.stdout.strip()
-        except FileNotFoundError:
-            logger.error("Command not found: %s", command[0])
-            return f"Error: command '{command[0]}' not found."
-        except Exception as e:
-            logger.error("Failed to run command '%s': %s", " ".join(command), e)
-            return "Error: failed to execute command."
-
-    # Check active and enabled status
-    status["running"] = run_command(["systemctl", "is-active", "fail2ban"]) == "active"
-    status["enabled"] = (
-        run_command(["systemctl", "is-enabled", "fail2ban"]) == "enabled"
+    # One `systemctl show` covers is-active, is-enabled and the start time
+    commands = [
+        [
+            "systemctl",
+            "show",
+            "fail2ban",
+            "--property=ActiveState,UnitFileState,ActiveEnterTimestamp",
+        ]
+    ] + [["fail2ban-client", "status", jail] for jail in jail_names]
+    fetch_version = _fail2ban_version is None
+    if fetch_version:
+        commands.append(["fail2ban-client", "--version"])
+
+    # The commands are independent, so run them concurrently
+    show_output, *outputs = await asyncio.gather(
+        *(_run_command(command) for command in commands)
     )
-
-    # Get version
-    version_output = run_command(["fail2ban-client", "--version"])
-    if version_output:
-        status["version"] = version_output
+    jail_outputs = outputs[: len(jail_names)]
+
+    # Get version, caching it only once the client answered with one
+    if fetch_version:
+        version_output = outputs[-1]
+        if version_output.lower().startswith("fail2ban"):
+            _fail2ban_version = version_output
+        elif version_output:
+            status["version"] = version_output
+    if _fail2ban_version:
+        status["version"] = _fail2ban_version
+
+    # "KEY=value" lines; missing keys (e.g. systemctl failed) keep the defaults
+    properties = dict(
+        line.split("=", 1) for line in show_output.splitlines() if "=" in line
+    )
+    status["running"] = properties.get("ActiveState") == "active"
+    status["enabled"] = properties.get("UnitFileState") == "enabled"
 
     # Get start time
-    start_time_output = run_command(
-        ["systemctl", "show", "fail2ban", "--property=ActiveEnterTimestamp"]
-    )
-    if "ActiveEnterTimestamp=" in start_time_output:
-        ts_str = start_time_output.split("=", 1)[1]
-        try:
-            start_dt = parser.parse(ts_str)
+    ts_str = properties.get("ActiveEnterTimestamp")
+    if ts_str:
+        start_dt = _fast_parse_systemd_ts(ts_str)
+        if start_dt:
             status["start_time"] = start_dt.strftime("%Y-%m-%d %H:%M:%S")
-        except Exception:
+        else:
             logger.warning("Could not parse start time: %s", ts_str)
 
     # Obtaining status for each jail
-    for jail in jail_names:
-        jail_status_output = run_command(["fail2ban-client", "status", jail])
-        status["jail_statuses"][jail] = jail_status_output
+    for jail, jail_status_output in zip(jail_names, jail_outputs):
+        status["jail_statuses"][jail] = _parse_jail_status(jail_status_output)
 
     logger.info(
         "Retrieved fail2ban service status for jails: %s", ", ".join(jail_names)
@@ -184,73 +508,157 @@ def get_service_status(
     return status
 
 
-async def sync_log_to_db(db_manager: DBManager, config: Settings):
+class LogRecord(NamedTuple):
+    """A single Ban/Unban event parsed from the fail2ban log."""
+
+    ts: datetime
+    ip: str
+    jail: str
+    action: str
+    raw_line: str
+
+
+def _parse_log_records(data: bytes, end: int) -> List[LogRecord]:
+    """
+    Parses Ban/Unban events from the complete lines in data[:end], skipping
+    everything else. The whole buffer is matched by the regex engine at once.
+    """
+    records = []
+    for m in _LINE_RE.finditer(data, 0, end):
+        ts = _parse_match_ts(m)
+        if not ts:
+            continue
+        line_end = data.find(b"\n", m.end(), end)
+        records.append(
+            LogRecord(
+                ts=ts,
+                ip=m.group("ip").decode("ascii"),
+                jail=(m.group("jail") or b"Unknown").decode("utf-8", errors="replace"),
+                action=m.group("action").decode("ascii"),
+                raw_line=data[m.start() : line_end]
+                .strip()
+                .decode("utf-8", errors="replace"),
+            )
+        )
+    return records
+
+
+async def sync_log_to_db(db_manager: DBManager, config: Settings) -> int:
     """
     Scans the fail2ban log and inserts new ban/unban records into the database.
+    Returns the number of inserted records.
     """
     if not db_manager:
         logger.info("DBManager not available; skipping log sync.")
-        return
+        return 0
+
+    # File reads, parsing, GeoIP lookups and inserts all block; keep them off
+    # the event loop so handlers stay responsive during a large catch-up
+    return await asyncio.to_thread(_sync_log_to_db, db_manager, config)
+
 
+def _sync_log_to_db(db_manager: DBManager, config: Settings) -> int:
+    """Synchronous body of sync_log_to_db, run in a worker thread."""
     try:
-        with open(config.LOG_FILE, "r") as f:
-            lines = f.readlines()
+        st = os.stat(config.LOG_FILE)
+        inode, offset = db_manager.get_sync_state()
+        if st.st_ino != inode or st.st_size < offset:
+            # First run or the log was rotated/truncated: start from the beginning
+            logger.info("Log file changed or rotated; reading from the start.")
+            offset = 0
+
+        with open(config.LOG_FILE, "rb") as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), offset, 0, os.POSIX_FADV_SEQUENTIAL)
+            f.seek(offset)
+            data = f.read()
+        # A partial last line is still being written; pick it up next time
+        end = data.rfind(b"\n") + 1
+        offset += end
+        records = _parse_log_records(data, end)
     except Exception as e:
         logger.error("Failed to read log file for sync: %s", e)
-        return
-
-    inserted_count = 0
-    for line in lines:
-        action = None
-        if "Ban " in line or " ban " in line:
-            action = "Ban"
-        elif "Unban " in line or " unban " in line:
-            action = "Unban"
-        else:
-            continue
-
-        ip_match = re.search(
-            r"(Ban|Unban) ([0-9]{1,3}(?:\.[0-9]{1,3}){3}|[0-9a-fA-F:]+)", line
-        )
-        if not ip_match:
-            continue
-        ip = ip_match.group(2)
-
-        ts = parse_log_timestamp(line) or datetime.now()
+        return 0
 
-        if db_manager.ban_exists(ts, ip):
+    if not records:
+        db_manager.set_sync_state(st.st_ino, offset)
+        logger.info("Log sync completed. No new records to insert.")
+        return 0
+
+    # Diff against what is already stored, de-duplicating within the batch too
+    min_ts = min(r.ts for r in records)
+    seen = db_manager.fetch_existing_keys(since=min_ts)
+    new_records = []
+    for record in records:
+        key = (record.ts.strftime("%Y-%m-%d %H:%M:%S"), record.ip)
+        if key in seen:
             continue
-
-        jail_match = re.search(r"\[([^\]]+)\]", line)
-        jail = jail_match.group(1) if jail_match else "Unknown"
-
-        geo_info = get_geo_info(ip, config)
-
-        db_manager.insert_ban(
-            ip=ip,
-            jail=jail,
-            action=action,
-            country=geo_info.get("country"),
-            city=geo_info.get("city"),
-            raw_line=line.strip(),
-            ts=ts,
+        seen.add(key)
+        new_records.append(record)
+
+    # Resolve geolocation once per unique IP
+    geo_map = get_geo_info_many({r.ip for r in new_records}, config, db_manager)
+
+    rows = [
+        (
+            r.ts.strftime("%Y-%m-%d %H:%M:%S"),
+            r.ip,
+            r.jail,
+            r.action,
+            None,
+            geo_map[r.ip].get("country"),
+            geo_map[r.ip].get("city"),
+            r.raw_line,
         )
-        inserted_count += 1
+        for r in new_records
+    ]
+    inserted_count = db_manager.insert_bans_many(rows) if rows else 0
+    if inserted_count is None:
+        # Keep the old offset so the same lines are retried on the next sync
+        return 0
+    db_manager.set_sync_state(st.st_ino, offset)
 
     if inserted_count > 0:
         logger.info("Log sync completed. Inserted %d new records.", inserted_count)
     else:
         logger.info("Log sync completed. No new records to insert.")
 
+    return inserted_count
+
 
 async def periodic_log_sync(
-    db_manager: DBManager, config: Settings, interval_seconds: int = 300
+    db_manager: DBManager,
+    config: Settings,
+    interval_seconds: int = 300,
+    target_records: int = 10,
+    min_interval: int = 30,
+    max_interval: Optional[int] = None,
 ):
-    """Background task for periodic log synchronization."""
-    logger.info("Starting periodic log sync every %d seconds.", interval_seconds)
+    """
+    Background task for periodic log synchronization.
+    Ticks run every `interval_seconds`; ticks inserting more than `target_records`
+    shorten the sleep towards `min_interval`. Idle ticks double it up to
+    `max_interval` (twice the interval by default); any activity resets it.
+    """
+    if max_interval is None:
+        max_interval = 2 * interval_seconds
+    min_interval = min(min_interval, interval_seconds)
+    logger.info("Starting periodic log sync every ~%d seconds.", interval_seconds)
+    next_sleep = interval_seconds
     while True:
+        inserted = 0
         try:
-            await sync_log_to_db(db_manager, config)
+            inserted = await sync_log_to_db(db_manager, config)
         except Exception as e:
             logger.error("Error during periodic log sync: %s", e, exc_info=True)
-        await asyncio.sleep(interval_seconds)
+
+        if inserted:
+            # Quiet activity keeps the configured interval; only bursts speed up
+            next_sleep = max(
+                min_interval,
+                min(interval_seconds, interval_seconds * target_records / inserted),
+            )
+        else:
+            next_sleep = min(max_interval, max(next_sleep, min_interval) * 2)
+        logger.debug("Next log sync in %.0f seconds.", next_sleep)
+        await asyncio.sleep(next_sleep)
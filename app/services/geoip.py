@@ -1,47 +1,140 @@
 # app/services/geoip.py
+import asyncio
+import atexit
 import logging
+import os
+import shutil
 import tarfile
-from collections import OrderedDict
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict
+from typing import BinaryIO, Callable, Dict, Iterable, Optional, Tuple
 
 import aiohttp
 import geoip2.database
 from aiogram import Bot
+from maxminddb import InvalidDatabaseError
 
 from app.config import Settings
+from app.db_manager import DBManager
 
 logger = logging.getLogger(__name__)
 
-# Module-level cache
-MAX_CACHE_SIZE = 1000
-geo_cache = OrderedDict()
+# Shared GeoIP reader and its LRU lookup cache, created lazily on first lookup
+_reader: Optional[geoip2.database.Reader] = None
+_lookup: Optional[Callable[[str], Tuple[str, str]]] = None
+_reader_lock = threading.Lock()
+
+
+def _get_lookup(config: Settings) -> Callable[[str], Tuple[str, str]]:
+    """Returns the cached lookup function, opening the database on first use."""
+    global _reader, _lookup
+    if _lookup is None:
+        with _reader_lock:
+            if _lookup is None:
+                reader = geoip2.database.Reader(str(config.GEOIP_DB_PATH))
+                logger.info("Opened GeoIP database: %s", config.GEOIP_DB_PATH)
+
+                @lru_cache(maxsize=config.GEOIP_CACHE_SIZE)
+                def lookup(ip: str) -> Tuple[str, str]:
+                    try:
+                        response = reader.city(ip)
+                    except (geoip2.errors.AddressNotFoundError, ValueError):
+                        logger.debug("Address %s not found in GeoIP database.", ip)
+                        return "Unknown", "Unknown"
+                    return (
+                        response.country.name or "Unknown",
+                        response.city.name or "Unknown",
+                    )
+
+                _reader, _lookup = reader, lookup
+    return _lookup
+
+
+def open_geoip_reader(config: Settings) -> bool:
+    """
+    Opens the shared GeoIP reader ahead of the first lookup.
+    Returns False if the database cannot be opened (lookups retry lazily).
+    """
+    try:
+        _get_lookup(config)
+        return True
+    except Exception as e:
+        logger.warning("GeoIP database is not available: %s", e)
+        return False
+
+
+def close_geoip_reader():
+    """Closes the shared GeoIP reader and drops its cache; next lookup reopens."""
+    global _reader, _lookup
+    with _reader_lock:
+        if _reader is not None:
+            try:
+                _reader.close()
+            except Exception as e:
+                logger.warning("Failed to close GeoIP reader: %s", e)
+        _reader, _lookup = None, None
+
+
+atexit.register(close_geoip_reader)
 
 
 def get_geo_info(ip: str, config: Settings) -> Dict[str, str]:
     """
     Retrieves geolocation information for an IP address, with caching.
     """
-    if ip in geo_cache:
-        geo_cache.move_to_end(ip)
-        return geo_cache[ip]
-
     result = {"country": "Unknown", "city": "Unknown", "ip": ip}
     try:
-        with geoip2.database.Reader(config.GEOIP_DB_PATH) as reader:
-            response = reader.city(ip)
-            result["country"] = response.country.name or "Unknown"
-            result["city"] = response.city.name or "Unknown"
-    except geoip2.errors.AddressNotFoundError:
-        logger.debug("Address %s not found in GeoIP database.", ip)
+        try:
+            result["country"], result["city"] = _get_lookup(config)(ip)
+        except InvalidDatabaseError:
+            # The file was replaced or corrupted under the open reader; reopen once
+            logger.warning("GeoIP database became invalid, reopening it.")
+            close_geoip_reader()
+            result["country"], result["city"] = _get_lookup(config)(ip)
     except Exception as e:
         logger.debug("Geo lookup failed for %s: %s", ip, e)
+    return result
+
 
-    geo_cache[ip] = result
-    if len(geo_cache) > MAX_CACHE_SIZE:
-        geo_cache.popitem(last=False)
+def get_geo_info_many(
+    ips: Iterable[str], config: Settings, db_manager: Optional[DBManager] = None
+) -> Dict[str, Dict[str, str]]:
+    """
+    Resolves geolocation for a batch of IPs. Blocking; intended to be run
+    in a worker thread via asyncio.to_thread.
+    With a db_manager, locations persisted by earlier runs are reused and only
+    the remaining IPs are looked up in the GeoIP database (and then persisted).
+    """
+    ips = set(ips)
+    result = {}
+    hits = {}
+    if db_manager:
+        hits = db_manager.get_geo_cached(ips)
+        for ip, (country, city) in hits.items():
+            result[ip] = {
+                "country": country or "Unknown",
+                "city": city or "Unknown",
+                "ip": ip,
+            }
 
+    misses = [ip for ip in ips if ip not in result]
+    for ip in misses:
+        result[ip] = get_geo_info(ip, config)
+
+    if db_manager and ips:
+        # Refreshing the hits' recency in the same write keeps eviction LRU
+        db_manager.save_geo_cached(
+            [
+                (ip, result[ip]["country"], result[ip]["city"])
+                for ip in misses
+                if result[ip]["country"] != "Unknown"
+            ],
+            max_rows=config.GEOIP_DB_CACHE_SIZE,
+            hits=hits,
+        )
     return result
 
 
@@ -58,23 +151,43 @@ async def _send_telegram_alert(bot: Bot, config: Settings, text: str):
         logger.error("Failed to send Telegram alert: %s", e)
 
 
-async def download_file(url: str, dest_path: Path):
-    """Downloads a file asynchronously."""
-    try:
-        timeout = aiohttp.ClientTimeout(total=60)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as resp:
-                resp.raise_for_status()
-                with open(dest_path, "wb") as f:
-                    while True:
-                        chunk = await resp.content.read(8192)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-        logger.info("Successfully downloaded file to %s", dest_path)
-    except Exception as e:
-        logger.error("Failed to download GeoIP DB from %s: %s", url, e)
-        raise
+class _BlockingResponseReader:
+    """
+    Read-only file object over an aiohttp response body, for use from a worker
+    thread: each read() is scheduled on the event loop and waited for.
+    """
+
+    def __init__(self, content: aiohttp.StreamReader, loop: asyncio.AbstractEventLoop):
+        self._content = content
+        self._loop = loop
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        future = asyncio.run_coroutine_threadsafe(self._content.read(size), self._loop)
+        chunk = future.result()
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def _extract_mmdb(archive: BinaryIO, db_path: Path) -> bool:
+    """
+    Streams the archive and writes its .mmdb member to `db_path`.
+    The file is written next to the target and renamed into place, so an
+    interrupted download never leaves a truncated database behind.
+    """
+    tmp_path = db_path.with_name(db_path.name + ".tmp")
+    with tarfile.open(fileobj=archive, mode="r|gz", bufsize=1 << 20) as tar:
+        for member in tar:
+            if member.name.endswith(".mmdb"):
+                try:
+                    with tar.extractfile(member) as src, open(tmp_path, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+                    os.replace(tmp_path, db_path)
+                finally:
+                    tmp_path.unlink(missing_ok=True)
+                logger.info("Successfully extracted %s", db_path)
+                return True
+    return False
 
 
 async def update_geoip_db(bot: Bot, config: Settings):
@@ -84,12 +197,15 @@ async def update_geoip_db(bot: Bot, config: Settings):
     db_dir.mkdir(exist_ok=True, parents=True)
 
     if db_path.exists():
-        mtime = datetime.fromtimestamp(db_path.stat().st_mtime)
-        if datetime.now() - mtime < timedelta(days=28):
-            logger.info("GeoIP database is up to date. Next check in ~28 days.")
+        mtime = db_path.stat().st_mtime
+        if time.time() - mtime < config.GEOIP_UPDATE_DAYS * 86400:
+            logger.info(
+                "GeoIP database is up to date. Next check in ~%d days.",
+                config.GEOIP_UPDATE_DAYS,
+            )
             return
         update_type = "🔄 Updated GeoIP database"
-        body = f"📅 Previous update: {mtime.strftime('%Y-%m-%d')}"
+        body = f"📅 Previous update: {datetime.fromtimestamp(mtime):%Y-%m-%d}"
     else:
         update_type = "🆕 First-time GeoIP setup"
         body = "📂 Database will be downloaded for the first time."
@@ -110,23 +226,20 @@ async def update_geoip_db(bot: Bot, config: Settings):
         f"&license_key={config.MAXMIND_LICENSE_KEY}"
         f"&suffix=tar.gz"
     )
-    tar_path = db_dir / "GeoLite2-City.tar.gz"
 
     try:
-        logger.info("Downloading GeoLite2-City database...")
-        await download_file(url, tar_path)
-
-        logger.info("Extracting .mmdb file from archive...")
-        extracted = False
-        with tarfile.open(tar_path, "r:gz") as tar:
-            for member in tar.getmembers():
-                if member.name.endswith(".mmdb"):
-                    # Extract to the final destination with the correct name
-                    member.name = db_path.name
-                    tar.extract(member, path=db_dir)
-                    extracted = True
-                    logger.info("Successfully extracted %s", db_path)
-                    break
+        timeout = aiohttp.ClientTimeout(total=config.GEOIP_DOWNLOAD_TIMEOUT_SECONDS)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            logger.info("Downloading GeoLite2-City database...")
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                # Decompress and untar straight from the response in a worker
+                # thread; the archive itself is never stored
+                archive = _BlockingResponseReader(
+                    resp.content, asyncio.get_running_loop()
+                )
+                extracted = await asyncio.to_thread(_extract_mmdb, archive, db_path)
+                logger.info("Downloaded %d bytes", archive.bytes_read)
 
         if not extracted:
             raise FileNotFoundError("No .mmdb file found in the downloaded archive.")
@@ -142,5 +255,5 @@ async def update_geoip_db(bot: Bot, config: Settings):
         logger.error(error_msg, exc_info=True)
         await _send_telegram_alert(bot, config, error_msg)
     finally:
-        if tar_path.exists():
-            tar_path.unlink()
+        # Drop the cached reader so lookups pick up the new database file
+        close_geoip_reader()
@@ -1,12 +1,39 @@
 # app/utils/logging_setup.py
+import atexit
 import logging
+import queue
 import re
-from logging.handlers import RotatingFileHandler
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
 
 from app.config import load_config
 
 config = load_config()
 
+# Background thread that owns the real handlers (see setup_logging)
+_listener: Optional[QueueListener] = None
+
+# Telegram bot tokens as they appear in API URLs: "bot123456:ABC-def..."
+_TOKEN_RE = re.compile(r"bot\d+:[\w-]+")
+
+
+class TokenMaskFilter(logging.Filter):
+    """Replaces Telegram bot tokens in log messages before any handler sees them."""
+
+    def filter(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            # Bad format args: pass the record through unmasked so the handler
+            # reports it as a logging error instead of raising at the call site
+            return True
+        # Cheap substring check first; almost no record carries a token
+        if "bot" in message:
+            record.msg = _TOKEN_RE.sub("botXXX:XXX", message)
+            record.args = None
+        return True
+
 
 class ColoredFormatter(logging.Formatter):
     """Formatter for colored console output."""
@@ -36,19 +63,40 @@ class ColoredFormatter(logging.Formatter):
         logging.CRITICAL: BOLD_RED,
     }
 
-    def format(self, record):
-        color = self.COLORS.get(record.levelno, self.RESET)
-        icon = self.ICONS.get(record.levelno, "❓")
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Colored "icon LEVEL" prefixes are built once per level, not per record
+        self._level_prefix = {}
+        for level, color in self.COLORS.items():
+            name = logging.getLevelName(level)
+            self._level_prefix[level] = (
+                f"{color}{self.ICONS[level]} {name:<8}{self.RESET}"
+            )
+        # (second, colored asctime) of the last record; datefmt has no sub-seconds
+        self._asctime_cache = (None, "")
+
+    def _colored_asctime(self, record) -> str:
+        second = int(record.created)
+        cached_second, asctime = self._asctime_cache
+        if second != cached_second or self.datefmt is None:
+            asctime = f"{self.CYAN}{self.formatTime(record, self.datefmt)}{self.RESET}"
+            self._asctime_cache = (second, asctime)
+        return asctime
 
-        asctime = f"{self.CYAN}{self.formatTime(record, self.datefmt)}{self.RESET}"
-        levelname = f"{color}{icon} {record.levelname:<8}{self.RESET}"
-        name = f"{self.GREY}{record.name}{self.RESET}"
+    def format(self, record):
+        levelname = self._level_prefix.get(record.levelno)
+        if levelname is None:
+            levelname = f"{self.RESET}❓ {record.levelname:<8}{self.RESET}"
 
         message = record.getMessage()
-        # Sanitize potential bot tokens from logs
-        message = re.sub(r"bot\d+:[\w-]+", "botXXX:XXX", message)
-
-        formatted_message = f"{asctime} | {levelname} | {name}: {message}"
+        formatted_message = "%s | %s | %s%s%s: %s" % (
+            self._colored_asctime(record),
+            levelname,
+            self.GREY,
+            record.name,
+            self.RESET,
+            message,
+        )
         if record.exc_info:
             if not message.endswith("\n"):
                 formatted_message += "\n"
@@ -56,26 +104,96 @@ class ColoredFormatter(logging.Formatter):
         return formatted_message
 
 
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that writes through a 64 KiB buffer instead of flushing
+    after every record. The buffer is flushed for WARNING and above, every
+    `flush_interval` seconds by a background thread, on rollover and on close.
+    """
+
+    def __init__(
+        self,
+        *args,
+        flush_level: int = logging.WARNING,
+        flush_interval: float = 30.0,
+        buffer_size: int = 1 << 16,
+        **kwargs,
+    ):
+        self.buffer_size = buffer_size
+        self.flush_level = flush_level
+        super().__init__(*args, **kwargs)
+        self._stop_flusher = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_periodically,
+            args=(flush_interval,),
+            name="log-file-flusher",
+            daemon=True,
+        )
+        self._flusher.start()
+
+    def _open(self):
+        return open(
+            self.baseFilename,
+            self.mode,
+            buffering=self.buffer_size,
+            encoding=self.encoding,
+            errors=self.errors,
+        )
+
+    def _flush_periodically(self, interval: float):
+        while not self._stop_flusher.wait(interval):
+            self.force_flush()
+
+    def flush(self):
+        # StreamHandler.emit() calls flush() after every record; skip that and
+        # let the buffer fill up. Use force_flush() to write it out.
+        pass
+
+    def force_flush(self):
+        """Writes buffered records to the file."""
+        super().flush()
+
+    def emit(self, record):
+        super().emit(record)
+        if record.levelno >= self.flush_level:
+            self.force_flush()
+
+    def close(self):
+        self._stop_flusher.set()
+        self.force_flush()
+        super().close()
+
+
 def setup_logging():
-    """Configures logging for the application."""
+    """
+    Configures logging for the application.
+    Loggers only enqueue records; a background listener thread formats them
+    and writes to the console and file handlers.
+    """
+    global _listener
     log_level = getattr(logging, config.LOG_LEVEL.upper(), logging.INFO)
 
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level)
 
-    # Clear any existing handlers
+    # Clear any existing handlers and stop a previous listener
     if root_logger.hasHandlers():
         root_logger.handlers.clear()
+    if _listener is not None:
+        _listener.stop()
+
+    handlers = []
 
     # Console Handler with colors
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(ColoredFormatter(datefmt=config.DATE_FORMAT))
     console_handler.setLevel(log_level)
-    root_logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     # File Handler
+    file_error = None
     try:
-        file_handler = RotatingFileHandler(
+        file_handler = BufferedRotatingFileHandler(
             "bot.log", maxBytes=5 * 1024 * 1024, backupCount=2
         )
         file_formatter = logging.Formatter(
@@ -83,11 +201,33 @@ def setup_logging():
             datefmt=config.DATE_FORMAT,
         )
         file_handler.setFormatter(file_formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
     except Exception as e:
-        logging.error("Failed to set up file logging: %s", e)
+        file_error = e
+
+    # Every record passes through the queue handler, so masking tokens there
+    # covers both the console and the file output. (Logger-level filters on the
+    # root would not run for records propagated from child loggers.)
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(TokenMaskFilter())
+    root_logger.addHandler(queue_handler)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    if file_error:
+        logging.error("Failed to set up file logging: %s", file_error)
 
     # Silence noisy third-party loggers
     logging.getLogger("httpx").setLevel(logging.WARNING)
     logging.getLogger("urllib3").setLevel(logging.WARNING)
     logging.getLogger("matplotlib").setLevel(logging.WARNING)
+
+
+def stop_logging():
+    """Flushes queued log records and stops the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,141 +1,245 @@
 # app/utils/plotting.py
-import hashlib
 import logging
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
-from dateutil import parser
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Optional, Tuple
 
 import cartopy.crs as ccrs
 import cartopy.io.shapereader as shpreader
 import matplotlib
-import matplotlib.pyplot as plt
-import pandas as pd
+from matplotlib import font_manager
+from matplotlib.axes import Axes
+from matplotlib.figure import Figure
 from matplotlib.patches import Patch
+from PIL import Image, ImageDraw, ImageFont
 
 from app.config import Settings
 from app.db_manager import DBManager
-from app.services.fail2ban import parse_log_timestamp
-from app.services.geoip import get_geo_info
+from app.services.fail2ban import read_ban_timestamps
 
 # Use a non-interactive backend for matplotlib
 matplotlib.use("Agg")
 logger = logging.getLogger(__name__)
 
+# One Figure per plot shape, created on first use and cleared between renders.
+# Figures are built with the OO API, so they never touch pyplot's global state.
+_figures: Dict[str, Tuple[Figure, Axes]] = {}
+# Matplotlib objects are not thread-safe; plots are rendered from worker threads
+_plot_lock = threading.Lock()
 
+# Period plots are reused for PLOT_CACHE_TTL seconds
+PLOT_CACHE_TTL = 60.0
+# (hours, period_name) -> (expires_at, (plot_path, total))
+_period_plot_cache: Dict[Tuple[int, str], Tuple[float, Tuple[str, int]]] = {}
+# period_name -> (current_bans, prev_bans) last drawn into the comparison plot
+_comparison_plot_values: Dict[str, Tuple[int, int]] = {}
+_COMPARISON_SIZE = (600, 400)
+# lightcoral and seagreen at 80% opacity on white
+_COMPARISON_COLORS = ("#f39999", "#58a279")
+
+
+def _get_axes(name: str, figsize: Tuple[float, float]) -> Tuple[Figure, Axes]:
+    """Returns the pooled figure and axes for a plot shape, with the axes cleared."""
+    if name not in _figures:
+        fig = Figure(figsize=figsize)
+        _figures[name] = (fig, fig.add_subplot())
+    fig, ax = _figures[name]
+    ax.clear()
+    return fig, ax
+
+
+def close_plot_figures() -> None:
+    """Releases the pooled figures (called on shutdown)."""
+    with _plot_lock:
+        _figures.clear()
+
+
+@lru_cache(maxsize=4)
+def _pil_font(size: int) -> ImageFont.FreeTypeFont:
+    """Loads matplotlib's bundled DejaVu Sans at the given size for Pillow drawing."""
+    return ImageFont.truetype(font_manager.findfont("DejaVu Sans"), size)
+
+
+@lru_cache(maxsize=1)
+def _y_axis_label(text: str) -> Image.Image:
+    """Renders a y-axis label as a transparent image rotated to read bottom-up."""
+    font = _pil_font(12)
+    left, top, right, bottom = font.getbbox(text)
+    label = Image.new("RGBA", (right - left, bottom - top), (255, 255, 255, 0))
+    ImageDraw.Draw(label).text((-left, -top), text, fill="black", font=font)
+    return label.rotate(90, expand=True)
+
+
+@lru_cache(maxsize=512)
 def stable_color(text: str) -> str:
     """Generates a stable hex color based on a string hash."""
-    h = hashlib.sha1(text.encode("utf-8")).hexdigest()
-    return f"#{h[:6]}"
+    return "#%06x" % (zlib.crc32(text.encode("utf-8")) & 0xFFFFFF)
+
+
+@lru_cache(maxsize=4)
+def _load_country_shapes(resolution: str = "110m") -> tuple:
+    """Loads (name, geometry) pairs from the Natural Earth countries shapefile."""
+    shpfilename = shpreader.natural_earth(
+        resolution=resolution, category="cultural", name="admin_0_countries"
+    )
+    return tuple(
+        (record.attributes["NAME"], record.geometry)
+        for record in shpreader.Reader(shpfilename).records()
+    )
 
 
 def generate_single_period_plot(
     db_manager: DBManager, config: Settings, hours: int, period_name: str
-) -> Optional[str]:
-    """Generates a bar plot showing ban counts per interval within a period."""
-    now = datetime.now()
+) -> Tuple[Optional[str], int]:
+    """
+    Generates a bar plot showing ban counts per interval within a period.
+    Returns the plot path (None on failure) and the total number of bans plotted.
+    Results are reused for PLOT_CACHE_TTL seconds.
+    """
+    cache_key = (hours, period_name)
+    cached = _period_plot_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic() and Path(cached[1][0]).exists():
+        logger.debug("Reusing cached plot for %s", period_name)
+        return cached[1]
+
+    # Whole seconds, like the stored and logged timestamps, so the DB and log
+    # paths put boundary bans into the same buckets
+    now = datetime.now().replace(microsecond=0)
     start_time = now - timedelta(hours=hours)
 
     # Determine number of buckets and interval duration
     if hours <= 24:
         buckets = hours
         interval = timedelta(hours=1)
-        time_format = "%H:00"
+        label_format = "{0.hour:02d}:00"
         title_interval = "hour"
     elif hours <= 7 * 24:
         buckets = 7
         interval = timedelta(days=1)
-        time_format = "%m-%d"
+        label_format = "{0.month:02d}-{0.day:02d}"
         title_interval = "day"
     else:
         buckets = 12
-        interval = timedelta(days=hours * 24 / buckets)
-        time_format = "%m-%d"
+        interval = timedelta(hours=hours / buckets)
+        label_format = "{0.month:02d}-{0.day:02d}"
         title_interval = "interval"
 
-    times, counts = [], []
-    current_bucket_start = start_time
+    bucket_seconds = interval.total_seconds()
+    counts = [0] * buckets
 
-    # Fetch all bans for the period at once to avoid re-reading file
-    all_bans_in_period = []
     if db_manager:
-        rows = db_manager.fetch_bans(since=start_time)
-        all_bans_in_period = [
-            parser.parse(r[0]) for r in rows if r[3] and "ban" in r[3].lower()
-        ]
+        # Let SQLite assign bans to buckets and count them
+        for idx, count in db_manager.fetch_bans_bucketed(
+            start_time, bucket_seconds
+        ).items():
+            # A ban in the current second lands exactly on the end boundary
+            if 0 <= idx <= buckets:
+                counts[min(idx, buckets - 1)] += count
     else:  # Fallback to log file
         try:
-            with open(config.LOG_FILE, "r") as f:
-                for line in f:
-                    if "Ban " in line or "ban " in line:
-                        ts = parse_log_timestamp(line)
-                        if ts and ts >= start_time:
-                            all_bans_in_period.append(ts)
+            # One pass over the log tail, incrementing each ban's bucket
+            for ts in read_ban_timestamps(config.LOG_FILE, start_time):
+                idx = (ts - start_time) // interval
+                if 0 <= idx <= buckets:
+                    counts[min(idx, buckets - 1)] += 1
         except Exception as e:
             logger.error("Failed to read log for plotting: %s", e)
 
-    # Aggregate counts into buckets
-    for _ in range(buckets):
-        next_bucket_end = current_bucket_start + interval
-        count = sum(
-            1
-            for ts in all_bans_in_period
-            if current_bucket_start <= ts < next_bucket_end
-        )
-
-        counts.append(count)
-        times.append(current_bucket_start.strftime(time_format))
-        current_bucket_start = next_bucket_end
-
-    plt.figure(figsize=(10, 5))
-    plt.bar(times, counts, color="steelblue", alpha=0.8)
-    plt.title(f"Bans per {title_interval} - Last {period_name}")
-    plt.ylabel("Number of Bans")
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
+    # str.format on datetime fields avoids the locale-aware strftime path
+    times = [label_format.format(start_time + i * interval) for i in range(buckets)]
 
+    total = sum(counts)
     plot_path = config.TMP_DIR / f"fail2ban_plot_{period_name.lower()}.png"
     try:
-        plt.savefig(plot_path)
-        plt.close()
+        with _plot_lock:
+            fig, ax = _get_axes("single", (10, 5))
+            ax.bar(range(buckets), counts, color="steelblue", alpha=0.8)
+            ax.set_xticks(range(buckets), times, rotation=45, ha="right")
+            ax.set_title(f"Bans per {title_interval} - Last {period_name}")
+            ax.set_ylabel("Number of Bans")
+            fig.tight_layout()
+            # Transient file read once by Telegram: favour encode speed over size
+            fig.savefig(
+                plot_path,
+                dpi=80,
+                pil_kwargs={"compress_level": 1, "optimize": False},
+            )
         logger.info("Generated plot: %s", plot_path)
-        return str(plot_path)
+        result = (str(plot_path), total)
+        _period_plot_cache[cache_key] = (time.monotonic() + PLOT_CACHE_TTL, result)
+        return result
     except Exception as e:
         logger.error("Failed to save plot %s: %s", plot_path, e)
-        return None
+        return None, total
 
 
 def generate_comparison_plot(
     current_bans: int, prev_bans: int, period_name: str, config: Settings
 ) -> Optional[str]:
     """Generates a comparison bar plot between current and previous period bans."""
-    plt.figure(figsize=(6, 4))
-    bars = plt.bar(
-        ["Previous Period", "Current Period"],
-        [prev_bans, current_bans],
-        color=["lightcoral", "seagreen"],
-        alpha=0.8,
-    )
-    plt.title(f"Ban Comparison: {period_name}")
-    plt.ylabel("Number of Bans")
-
-    # Add labels on top of bars
-    for bar in bars:
-        height = bar.get_height()
-        plt.text(
-            bar.get_x() + bar.get_width() / 2,
-            height,
-            f"{int(height)}",
-            ha="center",
-            va="bottom",
-            fontsize=10,
-        )
-
-    plt.tight_layout()
     plot_path = config.TMP_DIR / f"fail2ban_compare_{period_name.lower()}.png"
+    # The plot depends only on the two numbers; skip redrawing identical ones
+    values = (current_bans, prev_bans)
+    if _comparison_plot_values.get(period_name) == values and plot_path.exists():
+        logger.debug("Reusing comparison plot: %s", plot_path)
+        return str(plot_path)
+
+    # Two bars do not need matplotlib; drawing them with Pillow is much cheaper
+    width, height = _COMPARISON_SIZE
+    top, bottom = 70, height - 50
+    peak = max(current_bans, prev_bans, 1)
+    bars = [
+        ("Previous Period", prev_bans, _COMPARISON_COLORS[0]),
+        ("Current Period", current_bans, _COMPARISON_COLORS[1]),
+    ]
     try:
-        plt.savefig(plot_path)
-        plt.close()
+        image = Image.new("RGB", _COMPARISON_SIZE, "white")
+        draw = ImageDraw.Draw(image)
+        draw.text(
+            (width / 2, 20),
+            f"Ban Comparison: {period_name}",
+            fill="black",
+            font=_pil_font(16),
+            anchor="mt",
+        )
+        # Axes: y-axis with its label on the left, x-axis along the bottom
+        axis_x = 50
+        draw.line([(axis_x, top - 10), (axis_x, bottom)], fill="black")
+        draw.line([(axis_x, bottom), (width - 40, bottom)], fill="black")
+        y_label = _y_axis_label("Number of Bans")
+        image.paste(
+            y_label,
+            (20, (top + bottom - y_label.height) // 2),
+            y_label,
+        )
+
+        for i, (label, value, color) in enumerate(bars):
+            center = width * (2 * i + 1) / 4
+            bar_top = bottom - (bottom - top) * value / peak
+            draw.rectangle([(center - 80, bar_top), (center + 80, bottom)], fill=color)
+            # Value above the bar, period name below the axis
+            draw.text(
+                (center, bar_top - 4),
+                str(value),
+                fill="black",
+                font=_pil_font(12),
+                anchor="mb",
+            )
+            draw.text(
+                (center, bottom + 8),
+                label,
+                fill="black",
+                font=_pil_font(12),
+                anchor="mt",
+            )
+
+        image.save(plot_path, "PNG", optimize=False, compress_level=1)
+        _comparison_plot_values[period_name] = values
         logger.info("Generated comparison plot: %s", plot_path)
         return str(plot_path)
     except Exception as e:
@@ -144,68 +248,64 @@ def generate_comparison_plot(
 
 
 def generate_world_map_plot(
-    ips: List[str], title: str, config: Settings
+    country_counts: Dict[str, int], title: str, config: Settings
 ) -> Optional[str]:
     """Generates a world map highlighting countries with banned IPs."""
-    if not ips:
-        logger.warning("Attempted to generate world map with no IPs.")
-        return None
-
     try:
-        geo_data = [get_geo_info(ip, config) for ip in ips]
-        df = pd.DataFrame(geo_data)
-        country_counts = df["country"].value_counts().to_dict()
-
         # Remove 'Unknown' country from plotting if it exists
+        country_counts = Counter(country_counts)
         country_counts.pop("Unknown", None)
         if not country_counts:
             logger.info("No IPs with known countries to plot on map.")
             return None
 
-        shpfilename = shpreader.natural_earth(
-            resolution="110m", category="cultural", name="admin_0_countries"
-        )
-        countries_shape = list(shpreader.Reader(shpfilename).records())
-
-        crs = ccrs.Robinson()
-        fig, ax = plt.subplots(figsize=(15, 8), subplot_kw={"projection": crs})
-        ax.set_global()
-        ax.stock_img()
+        with _plot_lock:
+            crs = ccrs.Robinson()
+            fig = Figure(figsize=(15, 8))
+            ax = fig.add_subplot(projection=crs)
+            ax.set_global()
+            ax.stock_img()
 
-        for country_shape in countries_shape:
-            name = country_shape.attributes["NAME"]
-            if name in country_counts:
-                color = stable_color(name)
+            colors = {country: stable_color(country) for country in country_counts}
+            # Countries that share a color are drawn as a single artist
+            geometries_by_color = defaultdict(list)
+            for name, geometry in _load_country_shapes():
+                if name in colors:
+                    geometries_by_color[colors[name]].append(geometry)
+            for color, geometries in geometries_by_color.items():
                 ax.add_geometries(
-                    [country_shape.geometry],
+                    geometries,
                     crs=ccrs.PlateCarree(),
                     facecolor=color,
                     edgecolor="black",
                     linewidth=0.5,
                 )
 
-        legend_patches = [
-            Patch(color=stable_color(country), label=f"{country} ({count})")
-            for country, count in sorted(
-                country_counts.items(), key=lambda item: item[1], reverse=True
-            )[
-                :20
-            ]  # Top 20
-        ]
-        if legend_patches:
-            ax.legend(
-                handles=legend_patches,
-                loc="lower left",
-                fontsize=8,
-                title="Top Countries by Bans",
-                title_fontsize=9,
-            )
+            legend_patches = [
+                Patch(color=colors[country], label=f"{country} ({count})")
+                for country, count in country_counts.most_common(20)  # Top 20
+            ]
+            if legend_patches:
+                ax.legend(
+                    handles=legend_patches,
+                    loc="lower left",
+                    fontsize=8,
+                    title="Top Countries by Bans",
+                    title_fontsize=9,
+                )
 
-        plt.title(title, fontsize=16, pad=20)
+            ax.set_title(title, fontsize=16, pad=20)
+            fig.tight_layout()
 
-        plot_path = config.TMP_DIR / "fail2ban_world_map.png"
-        plt.savefig(plot_path, dpi=120, bbox_inches="tight")
-        plt.close()
+            # JPEG encodes much faster than PNG for a map this size, and Telegram
+            # recompresses photos anyway
+            plot_path = config.TMP_DIR / "fail2ban_world_map.jpg"
+            fig.savefig(
+                plot_path,
+                dpi=config.PLOT_DPI,
+                format="jpg",
+                pil_kwargs={"quality": 85, "optimize": False},
+            )
 
         logger.info("Generated world map plot: %s", plot_path)
         return str(plot_path)
@@ -13,8 +13,13 @@ from app.db_manager import DBManager
 from app.handlers import common, stats
 from app.middlewares.admin import AdminMiddleware
 from app.services.fail2ban import periodic_log_sync
-from app.services.geoip import update_geoip_db
+from app.services.geoip import (
+    close_geoip_reader,
+    open_geoip_reader,
+    update_geoip_db,
+)
 from app.utils.logging_setup import setup_logging
+from app.utils.plotting import close_plot_figures
 
 logger = logging.getLogger(__name__)
 
@@ -23,25 +28,35 @@ async def on_startup(bot: Bot, db_manager: DBManager, config: Settings):
     """
     Actions to perform on bot startup.
     - Clean up old charts.
-    - Update GeoIP database.
+    - Update GeoIP database and open the shared reader.
     - Start periodic background tasks.
     """
     logger.info("Bot is starting up...")
 
-    # Clean old charts in temp directory
-    tmp_dir = Path(config.TMP_DIR)
-    for plot_file in tmp_dir.glob("fail2ban_*.png"):
-        try:
-            os.unlink(plot_file)
-            logger.debug("Removed old plot: %s", plot_file)
-        except Exception as e:
-            logger.warning("Failed to remove old plot %s: %s", plot_file, e)
-
-    # Initial GeoIP update
+    # Clean old charts in temp directory; one directory listing, no per-entry stat
+    with os.scandir(config.TMP_DIR) as entries:
+        for entry in entries:
+            if not (
+                entry.name.startswith("fail2ban_")
+                and entry.name.endswith((".png", ".jpg"))
+            ):
+                continue
+            try:
+                Path(entry.path).unlink(missing_ok=True)
+                logger.debug("Removed old plot: %s", entry.path)
+            except Exception as e:
+                logger.warning("Failed to remove old plot %s: %s", entry.path, e)
+
+    # Initial GeoIP update, then open the reader once for the whole run
     await update_geoip_db(bot, config)
+    await asyncio.to_thread(open_geoip_reader, config)
 
     # Start periodic background log synchronization
-    asyncio.create_task(periodic_log_sync(db_manager, config))
+    asyncio.create_task(
+        periodic_log_sync(
+            db_manager, config, interval_seconds=config.BOT_SYNC_INTERVAL_SECONDS
+        )
+    )
     logger.info("Background tasks have been scheduled.")
 
 
@@ -50,9 +65,12 @@ async def on_shutdown(db_manager: DBManager):
     Function to perform actions on bot shutdown, such as closing database connection.
     """
     logger.info("Closing database connection...")
-    await db_manager.close()
+    db_manager.close()
     logger.info("Database connection closed.")
 
+    close_geoip_reader()
+    close_plot_figures()
+
 
 async def main():
     """Main function to configure and run the bot."""
@@ -81,12 +99,13 @@ async def main():
     dp.message.middleware(AdminMiddleware(config.ADMINS))
     dp.callback_query.middleware(AdminMiddleware(config.ADMINS))
 
-    # Register routers
-    dp.include_routers(common.router, stats.router)
+    # Register routers (settings are bound into the handlers at build time)
+    dp.include_routers(common.build_router(config), stats.build_router(config))
     logger.info("Routers included.")
 
-    # Register startup hook
+    # Register startup and shutdown hooks
     dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
 
     try:
         logger.info("Starting polling...")